@@ -1,5 +1,8 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy import text
+import asyncio
 import os
 from dotenv import load_dotenv
 
@@ -13,7 +16,30 @@ if not DATABASE_URL:
 if DATABASE_URL.startswith("postgresql://"):
     DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+# Per-statement SQL logging; synchronous log I/O on every query, so opt-in only
+SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() in ("1", "true", "yes")
+
+# Connection pool settings (keep connections open across requests)
+POOL_SIZE = 20
+MAX_OVERFLOW = 10
+POOL_RECYCLE = 1800  # seconds
+
+# Statement caches: compiled SQL per engine (SQLAlchemy default 500) and
+# server-side prepared statements per asyncpg connection (dialect default 100)
+QUERY_CACHE_SIZE = 1200
+PREPARED_STATEMENT_CACHE_SIZE = 512
+
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=SQL_ECHO,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    pool_pre_ping=True,
+    pool_recycle=POOL_RECYCLE,
+    query_cache_size=QUERY_CACHE_SIZE,
+    connect_args={"prepared_statement_cache_size": PREPARED_STATEMENT_CACHE_SIZE},
+)
 
 AsyncSessionLocal = sessionmaker(
     bind=engine,
@@ -32,6 +58,30 @@ async def get_db():
         finally:
             await session.close()
 
+# Indexes from earlier schemas that a compound index now covers; dropped so
+# they stop costing a write on every insert
+OBSOLETE_INDEXES = (
+    "ix_chat_messages_session_id",  # covered by ix_chat_messages_session_created
+    "ix_chat_sessions_model_type",  # covered by ix_chat_sessions_model_updated
+)
+
+def _create_missing_indexes(conn):
+    # create_all skips existing tables, so indexes added later must be created explicitly
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_create_missing_indexes)
+        for name in OBSOLETE_INDEXES:
+            await conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+async def warm_pool(size: int = POOL_SIZE):
+    """Open `size` connections concurrently so the first requests skip the connect handshake"""
+    async def checkout():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(checkout() for _ in range(size)))
@@ -3,22 +3,59 @@ Orchid219 Backend - FastAPI Application
 Local LLM Translation using TranslateGemma 12B
 """
 
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.routes import translation, chat, history
-from app.database import init_db
+from app.database import init_db, warm_pool
+from app.services.ollama_service import OllamaService, create_ollama_client, warm_ollama_client
+
+# Log level from env (e.g. LOG_LEVEL=DEBUG); debug logs cost nothing when disabled
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Expect uvloop when started via start.sh (--loop uvloop)
+    logger.info("Event loop policy: %s", type(asyncio.get_event_loop_policy()).__name__)
+    
+    # Initialize Database on Startup
+    await init_db()
+    await warm_pool()
+    
+    # One OllamaService (and connection pool) for every route, created on the serving loop
+    ollama_client = create_ollama_client()
+    app.state.ollama = OllamaService(client=ollama_client)
+    warmed = await warm_ollama_client(ollama_client)
+    logger.info("Ollama connections warmed: %d", warmed)
+    
+    yield
+    
+    # Wait for pending writes so they are not lost, then release Ollama connections
+    if app.state.background_tasks:
+        await asyncio.gather(*app.state.background_tasks, return_exceptions=True)
+    await ollama_client.aclose()
+
 
 app = FastAPI(
     title="Orchid219 Translation API",
     description="Local LLM-powered translation using TranslateGemma 12B",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
-# Initialize Database on Startup
-@app.on_event("startup")
-async def on_startup():
-    await init_db()
+# Fire-and-forget tasks (e.g. chat persistence) that must finish before shutdown
+app.state.background_tasks = set()
 
 # CORS configuration for Next.js frontend
 app.add_middleware(
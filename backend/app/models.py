@@ -1,22 +1,31 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Text, func
+from sqlalchemy import Column, String, DateTime, ForeignKey, Text, Index, func
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 from .database import Base
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
+    __table_args__ = (
+        # Session list is read as WHERE model_type = ? ORDER BY updated_at DESC;
+        # also serves plain model_type lookups (leftmost column)
+        Index("ix_chat_sessions_model_updated", "model_type", "updated_at"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    model_type = Column(String(50), nullable=False, index=True)  # gemma, deepqwen, llama, exaone
+    model_type = Column(String(50), nullable=False)  # gemma, deepqwen, llama, exaone
     title = Column(String(255), nullable=False, default="New Chat")
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), index=True)
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # History is always read as WHERE session_id = ? ORDER BY created_at
+        Index("ix_chat_messages_session_created", "session_id", "created_at"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    session_id = Column(UUID(as_uuid=True), ForeignKey("chat_sessions.id", ondelete="CASCADE"), nullable=False, index=True)
+    session_id = Column(UUID(as_uuid=True), ForeignKey("chat_sessions.id", ondelete="CASCADE"), nullable=False)
     role = Column(String(20), nullable=False)  # user, assistant, system
     content = Column(Text, nullable=False)
     reasoning = Column(Text, nullable=True)  # For DeepSeek reasoning output
@@ -1,43 +1,42 @@
 """
 Chat API Routes - Refactored Version
 """
-from fastapi import APIRouter, HTTPException, File, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Request
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, field_validator
 from dataclasses import dataclass
-from typing import List, Optional, Tuple
-import json
+from functools import lru_cache
+from types import MappingProxyType
+from typing import AsyncGenerator, List, Optional, Set
+import orjson
 import asyncio
 import uuid
+from datetime import timedelta
 import logging
 
-from app.services.ollama_service import OllamaService
+from app.services.ollama_service import OllamaService, get_ollama_service
 from app.services.document_service import DocumentService
 from app.services.context_service import ContextService
 from app.database import AsyncSessionLocal
 from app.models import ChatSession, ChatMessage
-from sqlalchemy import select
+from sqlalchemy import select, insert, func
+from app.routing import ORJSONRoute
 
-# ============================================================
-# 설정 및 초기화
-# ============================================================
-
-
-# ============================================================
-
-router = APIRouter()
+router = APIRouter(route_class=ORJSONRoute)
 logger = logging.getLogger(__name__)
 
-ollama_service = OllamaService()
 document_service = DocumentService()
 
+# 같은 트랜잭션에 저장되는 유저/어시스턴트 메시지의 created_at 간격
+ASSISTANT_ORDER_OFFSET = timedelta(microseconds=1)
+
 # 모델 타입 매핑 (설정 파일로 분리 권장)
-MODEL_TYPE_MAP = {
+MODEL_TYPE_MAP = MappingProxyType({
     "deepseek-r1:32b": "deepqwen",
     "llama3.3:70b-instruct-q3_K_M": "llama",
     "gemma:2b": "gemma",
     "exaone4.0:32b": "exaone"
-}
+})
 
 
 # ============================================================
@@ -45,19 +44,33 @@ MODEL_TYPE_MAP = {
 # ============================================================
 
 class Message(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+    
     role: str
     content: str
 
 
 class ChatRequest(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+    
     messages: List[Message]
     model: str = "deepseek-r1:32b"
     document_context: Optional[str] = None
     session_id: Optional[str] = None
     attached_file_name: Optional[str] = None
+    
+    @field_validator("document_context")
+    @classmethod
+    def blank_document_to_none(cls, v: Optional[str]) -> Optional[str]:
+        """공백뿐인 첨부 문서는 없는 것으로 처리 (빈 system 프롬프트 방지)"""
+        if not v or v.isspace():
+            return None
+        return v
 
 
 class UploadResponse(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+    
     success: bool
     filename: str
     content: str
@@ -88,6 +101,7 @@ class ParsedResponse:
 # 유틸리티 함수
 # ============================================================
 
+@lru_cache(maxsize=32)
 def infer_model_type(model: str) -> str:
     """모델 문자열에서 타입 추론"""
     return MODEL_TYPE_MAP.get(model, model.split(":")[0])
@@ -110,12 +124,11 @@ def parse_thinking_tags(content: str) -> ParsedResponse:
     if "<think>" not in content:
         return ParsedResponse(content=content, reasoning=None)
     
-    # </think> 닫힘 태그가 있는 정상 케이스
-    if "</think>" in content:
-        parts = content.split("</think>", 1)
-        reasoning = parts[0].replace("<think>", "").strip()
-        final_content = parts[1].strip() if len(parts) > 1 else ""
-        return ParsedResponse(content=final_content, reasoning=reasoning)
+    # </think> 닫힘 태그가 있는 정상 케이스 (partition: 한 번의 스캔, 리스트 할당 없음)
+    head, sep, tail = content.partition("</think>")
+    if sep:
+        reasoning = head.replace("<think>", "").strip()
+        return ParsedResponse(content=tail.strip(), reasoning=reasoning)
     
     # <think>만 있고 닫히지 않은 경우 (스트리밍 중단 등)
     if content.strip().startswith("<think>"):
@@ -127,25 +140,44 @@ def parse_thinking_tags(content: str) -> ParsedResponse:
     return ParsedResponse(content=content, reasoning=None)
 
 
-def extract_content_from_sse(chunk: str) -> str:
-    """SSE 청크에서 content 추출"""
-    extracted = ""
+class SSEAccumulator:
+    """SSE 청크를 버퍼에 누적하며 이벤트 단위로 content를 추출"""
     
-    for line in chunk.split('\n'):
-        if not line.startswith('data: '):
-            continue
-        
-        data_str = line[6:]
-        if data_str == '[DONE]':
-            continue
+    def __init__(self):
+        self.buf = bytearray()
+        self.parts: List[str] = []
+    
+    def feed(self, chunk: bytes) -> None:
+        self.buf += chunk
         
-        try:
-            data = json.loads(data_str)
-            extracted += data.get('content', '')
-        except json.JSONDecodeError as e:
-            logger.debug(f"SSE JSON 파싱 스킵: {e}")
+        start = 0
+        with memoryview(self.buf) as mv:
+            while (end := self.buf.find(b"\n\n", start)) != -1:
+                self._parse_event(mv, start, end)
+                start = end + 2
+        # 완성된 이벤트만 제거하고 미완성 조각은 다음 청크를 위해 유지
+        del self.buf[:start]
     
-    return extracted
+    def _parse_event(self, mv: memoryview, start: int, end: int) -> None:
+        pos = start
+        while pos < end:
+            line_end = self.buf.find(b"\n", pos, end)
+            if line_end == -1:
+                line_end = end
+            
+            if (self.buf.startswith(b"data: ", pos, line_end)
+                    and not self.buf.startswith(b"[DONE]", pos + 6, line_end)):
+                try:
+                    data = orjson.loads(mv[pos + 6:line_end])
+                    self.parts.append(data.get("content", ""))
+                except (orjson.JSONDecodeError, AttributeError) as e:
+                    logger.debug("SSE JSON 파싱 스킵: %s", e)
+            
+            pos = line_end + 1
+    
+    @property
+    def content(self) -> str:
+        return "".join(self.parts)
 
 
 # ============================================================
@@ -160,6 +192,7 @@ async def prepare_session_context(
     세션 컨텍스트를 준비합니다.
     - 새 세션: UUID 생성, DB 조회 없음
     - 기존 세션: DB에서 세션 정보 + 히스토리 로드
+    - 잘못된 형식의 session_id: 400 에러
     """
     model_type = infer_model_type(model)
     
@@ -172,30 +205,36 @@ async def prepare_session_context(
             history=[]
         )
     
+    # 형식이 잘못된 ID는 DB 조회 전에 거절하고, 이후 쿼리에는 UUID 객체를 재사용
+    try:
+        sid = uuid.UUID(session_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid UUID format")
+    
     # 기존 세션 조회
     async with AsyncSessionLocal() as db:
         result = await db.execute(
-            select(ChatSession).where(ChatSession.id == session_id)
+            select(ChatSession.model_type).where(ChatSession.id == sid)
         )
-        session = result.scalar_one_or_none()
+        session_model_type = result.scalar_one_or_none()
         
         # 세션 ID는 있지만 DB에 없는 경우
-        if not session:
-            logger.info(f"세션 ID {session_id}가 DB에 없음. 새 세션으로 처리")
+        if session_model_type is None:
+            logger.info("세션 ID %s가 DB에 없음. 새 세션으로 처리", sid)
             return SessionContext(
-                session_id=session_id,
+                session_id=str(sid),
                 is_new=True,
                 model_type=model_type,
                 history=[]
             )
         
         # 기존 세션 - 히스토리도 로드
-        history = await ContextService.get_chat_history(session_id)
+        history = await ContextService.get_chat_history(sid, db)
         
         return SessionContext(
-            session_id=session_id,
+            session_id=str(sid),
             is_new=False,
-            model_type=session.model_type,
+            model_type=session_model_type,
             history=history
         )
 
@@ -205,6 +244,7 @@ async def prepare_session_context(
 # ============================================================
 
 async def generate_title_safe(
+    ollama_service: OllamaService,
     user_content: str,
     assistant_content: str,
     model: str
@@ -218,7 +258,7 @@ async def generate_title_safe(
         )
         return title or "New Chat"
     except Exception as e:
-        logger.warning(f"타이틀 생성 실패: {e}")
+        logger.warning("타이틀 생성 실패: %s", e)
         return "New Chat"
 
 
@@ -232,7 +272,8 @@ async def save_conversation(
     user_msg: Message,
     assistant_content: str,
     model_type: str,
-    request: ChatRequest
+    request: ChatRequest,
+    ollama_service: OllamaService
 ) -> None:
     """
     스트리밍 완료 후 대화를 저장합니다.
@@ -245,7 +286,7 @@ async def save_conversation(
     parsed = parse_thinking_tags(assistant_content)
     
     if not parsed.content and not parsed.reasoning:
-        logger.warning(f"저장할 내용 없음: session={session_id}")
+        logger.warning("저장할 내용 없음: session=%s", session_id)
         return
     
     assistant_role = determine_assistant_role(model_type, request.model)
@@ -253,48 +294,56 @@ async def save_conversation(
     async def do_save():
         async with AsyncSessionLocal() as db:
             try:
+                # 읽어올 필요가 없는 쓰기 경로이므로 ORM unit-of-work 대신 Core INSERT 사용
                 # 새 세션인 경우 세션 레코드 생성
                 if is_new_session:
                     title = await generate_title_safe(
+                        ollama_service,
                         user_msg.content,
                         parsed.content,
                         request.model
                     )
                     
-                    new_session = ChatSession(
-                        id=session_id,
-                        model_type=model_type,
-                        title=title
-                    )
-                    db.add(new_session)
-                    await db.flush()
-                    logger.debug(f"새 세션 생성 및 플러시: {session_id}, title={title}")
-    
-                    # 유저 메시지 저장 (새 세션일 때만 - 기존 세션은 별도 처리)
-                    if is_new_session:
-                        user_message = ChatMessage(
-                            session_id=session_id,
-                            role="user",
-                            content=user_msg.content,
-                            attached_file_name=request.attached_file_name,
-                            attached_file_context=request.document_context
+                    await db.execute(
+                        insert(ChatSession).values(
+                            id=session_id,
+                            model_type=model_type,
+                            title=title
                         )
-                        db.add(user_message)
+                    )
+                    logger.debug("새 세션 생성: %s, title=%s", session_id, title)
+                
+                rows = []
+                
+                # 유저 메시지 (기존 세션은 user 역할일 때만)
+                if is_new_session or user_msg.role == "user":
+                    rows.append({
+                        "session_id": session_id,
+                        "role": "user",
+                        "content": user_msg.content,
+                        "reasoning": None,
+                        "attached_file_name": request.attached_file_name,
+                        "attached_file_context": request.document_context,
+                        "created_at": func.now()
+                    })
                 
-                # 어시스턴트 메시지 저장
-                assistant_message = ChatMessage(
-                    session_id=session_id,
-                    role=assistant_role,
-                    content=parsed.content,
-                    reasoning=parsed.reasoning
-                )
-                db.add(assistant_message)
+                # 어시스턴트 메시지 (트랜잭션 내 now()는 동일하므로 1µs 뒤로 지정해 순서 보장)
+                rows.append({
+                    "session_id": session_id,
+                    "role": assistant_role,
+                    "content": parsed.content,
+                    "reasoning": parsed.reasoning,
+                    "attached_file_name": None,
+                    "attached_file_context": None,
+                    "created_at": func.now() + ASSISTANT_ORDER_OFFSET
+                })
                 
+                await db.execute(insert(ChatMessage).values(rows))
                 await db.commit()
-                logger.info(f"대화 저장 완료: session={session_id}, new={is_new_session}")
+                logger.info("대화 저장 완료: session=%s, new=%s", session_id, is_new_session)
                 
             except Exception as e:
-                logger.error(f"대화 저장 실패: {e}", exc_info=True)
+                logger.error("대화 저장 실패: %s", e, exc_info=True)
                 await db.rollback()
                 raise
     
@@ -302,32 +351,9 @@ async def save_conversation(
     try:
         await asyncio.shield(do_save())
     except asyncio.CancelledError:
-        logger.info(f"저장 작업이 shield로 보호됨: session={session_id}")
+        logger.info("저장 작업이 shield로 보호됨: session=%s", session_id)
     except Exception as e:
-        logger.error(f"저장 중 예외: {e}")
-
-
-async def save_user_message_for_existing_session(
-    session_id: str,
-    user_msg: Message,
-    request: ChatRequest
-) -> None:
-    """기존 세션에 유저 메시지만 저장 (스트리밍 시작 전)"""
-    async with AsyncSessionLocal() as db:
-        try:
-            message = ChatMessage(
-                session_id=session_id,
-                role="user",
-                content=user_msg.content,
-                attached_file_name=request.attached_file_name,
-                attached_file_context=request.document_context
-            )
-            db.add(message)
-            await db.commit()
-            logger.debug(f"유저 메시지 저장 (기존 세션): session={session_id}")
-        except Exception as e:
-            logger.error(f"유저 메시지 저장 실패: {e}")
-            await db.rollback()
+        logger.error("저장 중 예외: %s", e)
 
 
 # ============================================================
@@ -338,20 +364,22 @@ async def stream_and_save(
     ctx: SessionContext,
     user_msg: Message,
     messages_payload: List[dict],
-    request: ChatRequest
-):
+    request: ChatRequest,
+    ollama_service: OllamaService,
+    background_tasks: Set[asyncio.Task]
+) -> AsyncGenerator[bytes, None]:
     """
-    Ollama 스트리밍 응답을 전달하고, 완료 후 DB에 저장합니다.
+    Ollama 스트리밍 응답을 전달하고, 완료 후 DB 저장을 백그라운드 태스크로 넘깁니다.
     
     SSE 형식:
-    - 새 세션: 첫 번째로 session_id 전송
-    - 이후: Ollama 응답 청크 그대로 전달
+    - 새 세션: 첫 번째로 session_id 전송 (버퍼링 없이 즉시)
+    - 이후: Ollama 응답 청크 전달 (토큰 병합은 chat_stream에서 처리)
     """
     # 새 세션이면 session_id를 먼저 전송
     if ctx.is_new:
-        yield f"data: {json.dumps({'session_id': ctx.session_id})}\n\n"
+        yield b"data: " + orjson.dumps({"session_id": ctx.session_id}) + b"\n\n"
     
-    full_content = ""
+    accumulator = SSEAccumulator()
     stream_error = None
     
     try:
@@ -359,35 +387,39 @@ async def stream_and_save(
             messages=messages_payload,
             model=request.model
         ):
-            if not chunk.strip():
-                continue
-            
+            # chat_stream은 이미 인코딩·병합된 SSE bytes 프레임만 yield (빈 청크 없음)
+            # → strip 검사/재인코딩 없이 그대로 전달
+            accumulator.feed(chunk)
             yield chunk
-            full_content += extract_content_from_sse(chunk)
             
     except asyncio.CancelledError:
-        logger.info(f"클라이언트 연결 끊김: session={ctx.session_id}")
+        logger.info("클라이언트 연결 끊김: session=%s", ctx.session_id)
         # 부분 저장을 위해 에러를 기록하지만 finally로 진행
         raise
         
     except Exception as e:
-        logger.error(f"스트리밍 에러: {e}", exc_info=True)
+        logger.error("스트리밍 에러: %s", e, exc_info=True)
         stream_error = str(e)
-        yield f"data: {json.dumps({'error': stream_error})}\n\n"
+        yield b"data: " + orjson.dumps({"error": stream_error}) + b"\n\n"
         
     finally:
-        # 저장할 내용이 있으면 저장
+        # 저장할 내용이 있으면 저장 (응답 종료를 DB 커밋까지 기다리지 않음)
+        full_content = accumulator.content
         if full_content:
-            await save_conversation(
+            task = asyncio.create_task(save_conversation(
                 session_id=ctx.session_id,
                 is_new_session=ctx.is_new,
                 user_msg=user_msg,
                 assistant_content=full_content,
                 model_type=ctx.model_type,
-                request=request
-            )
+                request=request,
+                ollama_service=ollama_service
+            ))
+            # 태스크가 GC되지 않도록 참조 유지, 종료 시 앱 shutdown에서 대기
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
         else:
-            logger.warning(f"저장할 응답 없음: session={ctx.session_id}")
+            logger.warning("저장할 응답 없음: session=%s", ctx.session_id)
 
 
 # ============================================================
@@ -407,41 +439,43 @@ async def upload_document(file: UploadFile = File(...)):
 
 
 @router.post("/stream")
-async def chat_stream(request: ChatRequest):
+async def chat_stream(
+    request: ChatRequest,
+    http_request: Request,
+    ollama_service: OllamaService = Depends(get_ollama_service)
+):
     """
     채팅 스트리밍 엔드포인트
     
     Lazy Persistence 구현:
     - 새 세션: 응답 완료 후에만 세션 + 메시지 저장
-    - 기존 세션: 유저 메시지 즉시 저장, 어시스턴트 응답은 완료 후 저장
+    - 기존 세션: 응답 완료 후 유저 + 어시스턴트 메시지를 한 트랜잭션으로 저장
     """
     # 입력 검증
     if not request.messages:
         raise HTTPException(status_code=400, detail="Messages cannot be empty")
     
     user_msg = request.messages[-1]
+    logger.debug("input model=%s messages_len=%d", request.model, len(request.messages))
     
     # 1. 세션 컨텍스트 준비
     ctx = await prepare_session_context(request.session_id, request.model)
-    logger.info(f"세션 준비: id={ctx.session_id}, new={ctx.is_new}, model_type={ctx.model_type}")
-    
-    # 2. 기존 세션이면 유저 메시지 먼저 저장
-    if not ctx.is_new and user_msg.role == "user":
-        await save_user_message_for_existing_session(ctx.session_id, user_msg, request)
-    
-    # 3. 메시지 페이로드 구성
-    # 기존 세션: 히스토리에서 마지막 메시지 제외 (방금 저장한 유저 메시지와 중복 방지)
-    history_for_context = ctx.history[:-1] if ctx.history and not ctx.is_new else ctx.history
+    logger.info("세션 준비: id=%s, new=%s, model_type=%s", ctx.session_id, ctx.is_new, ctx.model_type)
     
+    # 2. 메시지 페이로드 구성
+    # 유저 메시지는 아직 저장 전이므로 히스토리에 포함되어 있지 않음
     messages_payload = ContextService.build_context_messages(
-        history=history_for_context,
+        history=ctx.history,
         new_message={"role": "user", "content": user_msg.content},
         document_context=request.document_context,
         model=request.model
     )
     
-    # 4. 스트리밍 응답 반환
+    # 3. 스트리밍 응답 반환
     return StreamingResponse(
-        stream_and_save(ctx, user_msg, messages_payload, request),
+        stream_and_save(
+            ctx, user_msg, messages_payload, request, ollama_service,
+            http_request.app.state.background_tasks
+        ),
         media_type="text/event-stream"
     )
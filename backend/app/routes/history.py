@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete, desc
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select, desc, delete, insert, update
+from functools import lru_cache
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
@@ -9,8 +10,9 @@ import uuid
 
 from app.database import get_db
 from app.models import ChatSession, ChatMessage
+from app.routing import ORJSONRoute
 
-router = APIRouter()
+router = APIRouter(route_class=ORJSONRoute)
 
 # --- Pydantic Models for Response ---
 class MessageResponse(BaseModel):
@@ -39,7 +41,29 @@ class CreateSessionRequest(BaseModel):
 class UpdateTitleRequest(BaseModel):
     title: str
 
+@lru_cache(maxsize=1024)
+def _parse_uuid_cached(s: str) -> uuid.UUID:
+    return uuid.UUID(s)
+
+async def session_uuid(session_id: str) -> uuid.UUID:
+    """Path-param dependency: the session id as a UUID, 400 if malformed"""
+    try:
+        return _parse_uuid_cached(session_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid UUID format")
+
+def _session_to_dict(s: ChatSession) -> dict:
+    return {
+        "id": str(s.id),
+        "model_type": s.model_type,
+        "title": s.title,
+        "created_at": s.created_at,
+        "updated_at": s.updated_at,
+    }
+
 # --- Endpoints ---
+# Read endpoints return ORJSONResponse directly: FastAPI skips response_model
+# validation/jsonable_encoder for Response objects, the models only document the schema.
 
 @router.get("/{model_type}", response_model=List[SessionResponse])
 async def get_sessions(model_type: str, db: AsyncSession = Depends(get_db)):
@@ -48,116 +72,102 @@ async def get_sessions(model_type: str, db: AsyncSession = Depends(get_db)):
     result = await db.execute(query)
     sessions = result.scalars().all()
     
-    return [
-        SessionResponse(
-            id=str(s.id),
-            model_type=s.model_type,
-            title=s.title,
-            created_at=s.created_at,
-            updated_at=s.updated_at
-        ) for s in sessions
-    ]
+    return ORJSONResponse([_session_to_dict(s) for s in sessions])
 
 @router.get("/session/{session_id}", response_model=SessionDetailResponse)
-async def get_session_detail(session_id: str, db: AsyncSession = Depends(get_db)):
+async def get_session_detail(uuid_id: uuid.UUID = Depends(session_uuid), db: AsyncSession = Depends(get_db)):
     """Get a specific session with all its messages"""
-    try:
-        uuid_id = uuid.UUID(session_id)
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid UUID format")
-
-    # query = select(ChatSession).where(ChatSession.id == uuid_id).options(selectinload(ChatSession.messages))
-    # Note: We need relationship in models.py for selectinload, adding it below implicitly or manually querying messages
-    # Let's manually query to avoid circular dependency or complex model setup for now if relationship is missing
-    # Actually checking models.py -> relationship is missing. Let's fix models.py first or query separately.
-    # Querying separately is safer for now.
-    
-    session_result = await db.execute(select(ChatSession).where(ChatSession.id == uuid_id))
-    session = session_result.scalar_one_or_none()
+    # Single round-trip: session columns outer-joined with its messages, no ORM hydration.
+    # A session without messages yields one row whose message columns are NULL.
+    query = (
+        select(
+            ChatSession.id,
+            ChatSession.model_type,
+            ChatSession.title,
+            ChatSession.created_at,
+            ChatSession.updated_at,
+            ChatMessage.id.label("message_id"),
+            ChatMessage.role,
+            ChatMessage.content,
+            ChatMessage.reasoning,
+            ChatMessage.attached_file_name,
+            ChatMessage.attached_file_context,
+            ChatMessage.created_at.label("message_created_at"),
+        )
+        .outerjoin(ChatMessage, ChatMessage.session_id == ChatSession.id)
+        .where(ChatSession.id == uuid_id)
+        .order_by(ChatMessage.created_at)
+    )
+    rows = (await db.execute(query)).all()
     
-    if not session:
+    if not rows:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    messages_result = await db.execute(
-        select(ChatMessage).where(ChatMessage.session_id == uuid_id).order_by(ChatMessage.created_at)
-    )
-    messages = messages_result.scalars().all()
-
-    return SessionDetailResponse(
-        id=str(session.id),
-        model_type=session.model_type,
-        title=session.title,
-        created_at=session.created_at,
-        updated_at=session.updated_at,
-        messages=[
-            MessageResponse(
-                id=str(m.id),
-                role=m.role,
-                content=m.content,
-                reasoning=m.reasoning,
-                attached_file_name=m.attached_file_name,
-                attached_file_context=m.attached_file_context,
-                created_at=m.created_at
-            ) for m in messages
-        ]
-    )
+    # orjson serializes UUID and datetime natively, so rows go straight into dicts
+    first = rows[0]
+    return ORJSONResponse({
+        "id": first.id,
+        "model_type": first.model_type,
+        "title": first.title,
+        "created_at": first.created_at,
+        "updated_at": first.updated_at,
+        "messages": [
+            {
+                "id": r.message_id,
+                "role": r.role,
+                "content": r.content,
+                "reasoning": r.reasoning,
+                "attached_file_name": r.attached_file_name,
+                "attached_file_context": r.attached_file_context,
+                "created_at": r.message_created_at,
+            } for r in rows if r.message_id is not None
+        ],
+    })
 
 @router.post("/session", response_model=SessionResponse)
 async def create_session(request: CreateSessionRequest, db: AsyncSession = Depends(get_db)):
     """Create a new chat session"""
-    new_session = ChatSession(
-        model_type=request.model_type,
-        title=request.title
+    # INSERT ... RETURNING brings back the id and server-default timestamps,
+    # so no refresh SELECT is needed after commit
+    result = await db.execute(
+        insert(ChatSession)
+        .values(model_type=request.model_type, title=request.title)
+        .returning(ChatSession)
     )
-    db.add(new_session)
+    new_session = result.scalar_one()
     await db.commit()
-    await db.refresh(new_session)
     
-    return SessionResponse(
-        id=str(new_session.id),
-        model_type=new_session.model_type,
-        title=new_session.title,
-        created_at=new_session.created_at,
-        updated_at=new_session.updated_at
-    )
+    return ORJSONResponse(_session_to_dict(new_session))
 
 @router.delete("/session/{session_id}")
-async def delete_session(session_id: str, db: AsyncSession = Depends(get_db)):
+async def delete_session(uuid_id: uuid.UUID = Depends(session_uuid), db: AsyncSession = Depends(get_db)):
     """Delete a session"""
-    try:
-        uuid_id = uuid.UUID(session_id)
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid UUID format")
-        
-    query = select(ChatSession).where(ChatSession.id == uuid_id)
-    result = await db.execute(query)
-    session = result.scalar_one_or_none()
-    
-    if not session:
+    # One statement; messages go with it through the ON DELETE CASCADE foreign key
+    result = await db.execute(
+        delete(ChatSession).where(ChatSession.id == uuid_id).returning(ChatSession.id)
+    )
+    if result.scalar_one_or_none() is None:
         raise HTTPException(status_code=404, detail="Session not found")
         
-    await db.delete(session)
     await db.commit()
     
     return {"success": True, "message": "Session deleted"}
 
 @router.patch("/session/{session_id}/title")
-async def update_session_title(session_id: str, request: UpdateTitleRequest, db: AsyncSession = Depends(get_db)):
+async def update_session_title(request: UpdateTitleRequest, uuid_id: uuid.UUID = Depends(session_uuid), db: AsyncSession = Depends(get_db)):
     """Update session title"""
-    try:
-        uuid_id = uuid.UUID(session_id)
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid UUID format")
-        
-    query = select(ChatSession).where(ChatSession.id == uuid_id)
-    result = await db.execute(query)
-    session = result.scalar_one_or_none()
+    # UPDATE ... RETURNING instead of fetch-then-mutate; updated_at still bumps via onupdate
+    result = await db.execute(
+        update(ChatSession)
+        .where(ChatSession.id == uuid_id)
+        .values(title=request.title)
+        .returning(ChatSession.title)
+    )
+    title = result.scalar_one_or_none()
     
-    if not session:
+    if title is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    session.title = request.title
     await db.commit()
-    await db.refresh(session)
     
-    return {"success": True, "title": session.title}
+    return {"success": True, "title": title}
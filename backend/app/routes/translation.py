@@ -2,17 +2,17 @@
 Translation API Routes
 """
 
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+import asyncio
+import orjson
 
-from app.services.ollama_service import OllamaService
+from app.services.ollama_service import OllamaService, get_ollama_service
 from app.services.detection_service import DetectionService
+from app.routing import ORJSONRoute
 
-router = APIRouter()
-ollama_service = OllamaService()
-detection_service = DetectionService()
+router = APIRouter(route_class=ORJSONRoute)
 
 
 class TranslationRequest(BaseModel):
@@ -47,22 +47,29 @@ SUPPORTED_LANGUAGES = {
     "auto": "Auto-detect"
 }
 
+# Static payloads precomputed once at import time
+_LANGS_BYTES = orjson.dumps({"languages": SUPPORTED_LANGUAGES})
+_LANGS_SET = frozenset(SUPPORTED_LANGUAGES)
+
+# Detector limited to the languages we can translate
+detection_service = DetectionService(SUPPORTED_LANGUAGES)
+
 
 @router.get("/languages")
 async def get_languages():
     """Get list of supported languages"""
-    return {"languages": SUPPORTED_LANGUAGES}
+    return Response(content=_LANGS_BYTES, media_type="application/json")
 
 
-@router.post("/translate")
-async def translate(request: TranslationRequest):
+@router.post("/translate", response_model=TranslationResponse)
+async def translate(request: TranslationRequest, ollama_service: OllamaService = Depends(get_ollama_service)):
     """
     Translate text using TranslateGemma 12B
     """
     if not request.text.strip():
         raise HTTPException(status_code=400, detail="Text cannot be empty")
     
-    if request.target_lang not in SUPPORTED_LANGUAGES:
+    if request.target_lang not in _LANGS_SET:
         raise HTTPException(
             status_code=400, 
             detail=f"Unsupported target language: {request.target_lang}"
@@ -75,33 +82,35 @@ async def translate(request: TranslationRequest):
             target_lang=request.target_lang
         )
         
-        return TranslationResponse(
-            original=request.text,
-            translated=translated,
-            source_lang=request.source_lang,
-            target_lang=request.target_lang
-        )
+        # Fields come from the already validated request; skip re-validating them
+        # through TranslationResponse (the model only documents the schema)
+        return ORJSONResponse({
+            "original": request.text,
+            "translated": translated,
+            "source_lang": request.source_lang,
+            "target_lang": request.target_lang
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/translate/stream")
-async def translate_stream(request: TranslationRequest):
+async def translate_stream(request: TranslationRequest, ollama_service: OllamaService = Depends(get_ollama_service)):
     """
     Stream translation response using TranslateGemma 12B
     """
     if not request.text.strip():
         raise HTTPException(status_code=400, detail="Text cannot be empty")
     
-    async def generate():
-        async for chunk in ollama_service.translate_stream(
+    # translate_stream yields ready SSE bytes; StreamingResponse sends them as-is
+    return StreamingResponse(
+        ollama_service.translate_stream(
             text=request.text,
             source_lang=request.source_lang,
             target_lang=request.target_lang
-        ):
-            yield chunk
-    
-    return StreamingResponse(generate(), media_type="text/event-stream")
+        ),
+        media_type="text/event-stream"
+    )
 
 
 class DetectionRequest(BaseModel):
@@ -116,9 +125,10 @@ async def detect_language(request: DetectionRequest):
     if not request.text.strip():
         raise HTTPException(status_code=400, detail="Text cannot be empty")
         
-    detected_code = detection_service.detect_language(request.text)
+    # Detection is CPU work; keep it off the event loop
+    detected_code = await asyncio.to_thread(detection_service.detect_language, request.text)
     
-    # Map langdetect codes to our supported codes if necessary
+    # Map detector codes to our supported codes if necessary
     # straightforward for most (en, ko, ja, zh-cn -> zh)
     
     lang_code = detected_code
@@ -126,7 +136,7 @@ async def detect_language(request: DetectionRequest):
         lang_code = "zh"
     
     # Check if supported, otherwise default to auto or keep as is
-    is_supported = lang_code in SUPPORTED_LANGUAGES
+    is_supported = lang_code in _LANGS_SET
     
     return {
         "detected": lang_code,
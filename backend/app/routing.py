@@ -0,0 +1,32 @@
+"""
+Route class that parses JSON request bodies with orjson
+"""
+
+from typing import Any, Callable, Coroutine
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+import orjson
+
+
+class ORJSONRequest(Request):
+    """Request whose json() uses orjson instead of the stdlib json module"""
+
+    async def json(self) -> Any:
+        # Same caching as Starlette; orjson.JSONDecodeError subclasses
+        # json.JSONDecodeError, so FastAPI still answers malformed bodies with 422
+        if not hasattr(self, "_json"):
+            self._json = orjson.loads(await self.body())
+        return self._json
+
+
+class ORJSONRoute(APIRoute):
+    """APIRoute that hands endpoints an ORJSONRequest for body parsing"""
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        original_route_handler = super().get_route_handler()
+
+        async def orjson_route_handler(request: Request) -> Response:
+            return await original_route_handler(ORJSONRequest(request.scope, request.receive))
+
+        return orjson_route_handler
@@ -7,12 +7,19 @@ This service handles:
 3. Estimating token counts with Korean text support.
 """
 
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
+from bisect import bisect_left
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import accumulate
+import hashlib
+import uuid
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import AsyncSessionLocal
 from app.models import ChatMessage
+from app.services.text_utils import count_korean_chars
 
 
 # Model-specific context window limits (in tokens)
@@ -33,11 +40,32 @@ However, you may use Chinese characters (Hanja) in parentheses if it helps clari
 (한국어로 답변할 때는 주로 한글을 사용하되, 의미 명확화가 필요하거나 문맥상 적절한 경우(예: 사자성어, 전문용어)에는 괄호 안에 한자를 병기할 수 있습니다.)"""
 }
 
+# System prompt wrapper for a document attached to the current message
+DOC_CONTEXT_PREFIX = (
+    "다음은 사용자가 첨부한 문서의 내용입니다. 이 문서를 참고하여 질문에 답변해주세요.\n"
+    "--- 첨부 문서 시작 ---\n"
+)
+DOC_CONTEXT_SUFFIX = (
+    "\n--- 첨부 문서 끝 ---\n"
+    "위 문서 내용을 바탕으로 사용자의 질문에 정확하고 도움이 되는 답변을 제공해주세요."
+)
+
+# System prompt wrapper for a document attached earlier in the session
+PREV_DOC_CONTEXT_HEADER_FMT = (
+    "(이전 대화에서 첨부된 문서 '{file_name}')\n"
+    "다음은 사용자가 이전에 첨부한 문서({file_name})의 내용입니다. 계속해서 이 문서를 참고하여 답변해주세요.\n"
+    "--- 첨부 문서 시작 ({file_name}) ---\n"
+)
+PREV_DOC_CONTEXT_SUFFIX = "\n--- 첨부 문서 끝 ---\n"
+
 # Token estimation ratios (chars per token)
 # Korean text averages ~1.5-2 chars per token, English ~4 chars per token
 KOREAN_CHARS_PER_TOKEN = 1.8
 ENGLISH_CHARS_PER_TOKEN = 4.0
 
+# Overhead for role and message structure (~4 tokens per message)
+MESSAGE_OVERHEAD_TOKENS = 4
+
 
 def estimate_tokens(text: str) -> int:
     """
@@ -46,8 +74,17 @@ def estimate_tokens(text: str) -> int:
     """
     if not text:
         return 0
-    
-    korean_chars = sum(1 for c in text if '\uac00' <= c <= '\ud7a3' or '\u3131' <= c <= '\u318e')
+    return _estimate_tokens_cached(text)
+
+
+# History messages are re-estimated on every turn; content never changes, so memoize by text
+@lru_cache(maxsize=1024)
+def _estimate_tokens_cached(text: str) -> int:
+    return _estimate_tokens_uncached(text)
+
+
+def _estimate_tokens_uncached(text: str) -> int:
+    korean_chars = count_korean_chars(text)
     total_chars = len(text)
     english_chars = total_chars - korean_chars
     
@@ -57,43 +94,82 @@ def estimate_tokens(text: str) -> int:
     return int(korean_tokens + english_tokens) + 1  # +1 for safety margin
 
 
+# Attached documents (up to 50k chars) are re-sent on every turn of a session.
+# Key their estimates by a short digest so the cache never pins document text.
+DOC_TOKENS_CACHE_SIZE = 256
+_doc_tokens_cache: "OrderedDict[bytes, int]" = OrderedDict()
+
+
+def estimate_document_tokens(text: str) -> int:
+    """estimate_tokens for large document text, memoized by blake2b digest."""
+    if not text:
+        return 0
+    digest = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    tokens = _doc_tokens_cache.get(digest)
+    if tokens is None:
+        tokens = _estimate_tokens_uncached(text)
+        _doc_tokens_cache[digest] = tokens
+        if len(_doc_tokens_cache) > DOC_TOKENS_CACHE_SIZE:
+            _doc_tokens_cache.popitem(last=False)
+    else:
+        _doc_tokens_cache.move_to_end(digest)
+    return tokens
+
+
+# The prompt wrappers never change: estimate them once instead of per request
+_DOC_CONTEXT_WRAPPER_TOKENS = estimate_tokens(DOC_CONTEXT_PREFIX + DOC_CONTEXT_SUFFIX)
+_PREV_DOC_CONTEXT_SUFFIX_TOKENS = estimate_tokens(PREV_DOC_CONTEXT_SUFFIX)
+
+
+def estimate_message_tokens(msg: Dict) -> int:
+    """Estimate tokens for one message, reusing the count stashed by get_chat_history."""
+    tokens = msg.get("_tokens")
+    if tokens is None:
+        tokens = estimate_tokens(msg.get("content", ""))
+    return tokens + MESSAGE_OVERHEAD_TOKENS
+
+
 def estimate_messages_tokens(messages: List[Dict]) -> int:
     """Estimate total tokens for a list of messages."""
-    total = 0
-    for msg in messages:
-        # Add overhead for role and message structure (~4 tokens per message)
-        total += 4
-        total += estimate_tokens(msg.get("content", ""))
-    return total
+    return sum(estimate_message_tokens(msg) for msg in messages)
 
 
 class ContextService:
     """Service for managing conversation context."""
     
     @staticmethod
-    async def get_chat_history(session_id: str) -> List[Dict]:
+    async def get_chat_history(
+        session_id: Union[str, uuid.UUID],
+        db: Optional[AsyncSession] = None
+    ) -> List[Dict]:
         """
         Fetch chat history from the database for a given session.
         Returns messages in chronological order.
+        Pass the caller's `db` session to reuse its connection; otherwise a new one is opened.
         """
-        async with AsyncSessionLocal() as db:
-            result = await db.execute(
-                select(ChatMessage)
-                .where(ChatMessage.session_id == session_id)
-                .order_by(ChatMessage.created_at.asc())
+        if db is None:
+            async with AsyncSessionLocal() as db:
+                return await ContextService.get_chat_history(session_id, db)
+        
+        # Column-only select: rows come back as mappings, no ORM hydration
+        result = await db.execute(
+            select(
+                ChatMessage.role,
+                ChatMessage.content,
+                ChatMessage.reasoning,
+                ChatMessage.attached_file_name,
+                ChatMessage.attached_file_context,
             )
-            messages = result.scalars().all()
-            
-            return [
-                {
-                    "role": msg.role,
-                    "content": msg.content,
-                    "reasoning": msg.reasoning,
-                    "attached_file_name": msg.attached_file_name,
-                    "attached_file_context": msg.attached_file_context
-                }
-                for msg in messages
-            ]
+            .where(ChatMessage.session_id == session_id)
+            .order_by(ChatMessage.created_at.asc())
+        )
+        
+        history = []
+        for row in result.mappings():
+            msg = dict(row)
+            msg["_tokens"] = estimate_tokens(msg["content"])
+            history.append(msg)
+        return history
     
     @staticmethod
     def get_context_limit(model: str) -> int:
@@ -119,44 +195,45 @@ class ContextService:
         max_tokens = ContextService.get_context_limit(model)
         
         # 1. Build system message if document context exists
+        # The prompt is assembled from parts and estimated part by part, so the
+        # constant wrappers use their precomputed counts (a slight overestimate
+        # versus estimating the joined text, which only makes the budget safer)
         system_message = None
         system_tokens = 0
-        system_content = ""
-
-        if document_context:
-            system_content = f"""다음은 사용자가 첨부한 문서의 내용입니다. 이 문서를 참고하여 질문에 답변해주세요.
---- 첨부 문서 시작 ---
-{document_context}
---- 첨부 문서 끝 ---
-위 문서 내용을 바탕으로 사용자의 질문에 정확하고 도움이 되는 답변을 제공해주세요."""
+        system_parts: List[str] = []
+
+        if document_context and not document_context.isspace():
+            system_parts = [DOC_CONTEXT_PREFIX, document_context, DOC_CONTEXT_SUFFIX]
+            system_tokens = _DOC_CONTEXT_WRAPPER_TOKENS + estimate_document_tokens(document_context)
         else:
              # Try to find the most recent document context from history
              for msg in reversed(history):
                  if msg.get("attached_file_context"):
                      file_context = msg["attached_file_context"]
                      file_name = msg.get("attached_file_name", "Unknown File")
-                     system_content = f"""(이전 대화에서 첨부된 문서 '{file_name}')
-다음은 사용자가 이전에 첨부한 문서({file_name})의 내용입니다. 계속해서 이 문서를 참고하여 답변해주세요.
---- 첨부 문서 시작 ({file_name}) ---
-{file_context}
---- 첨부 문서 끝 ---
-"""
+                     header = PREV_DOC_CONTEXT_HEADER_FMT.format(file_name=file_name)
+                     system_parts = [header, file_context, PREV_DOC_CONTEXT_SUFFIX]
+                     system_tokens = (
+                         estimate_tokens(header)
+                         + estimate_document_tokens(file_context)
+                         + _PREV_DOC_CONTEXT_SUFFIX_TOKENS
+                     )
                      break
         
         # Append language instruction if configured for the model
         language_instruction = DEFAULT_SYSTEM_PROMPTS.get(model)
         if language_instruction:
-            if system_content:
-                system_content += f"\n\n{language_instruction}"
-            else:
-                system_content = language_instruction
+            if system_parts:
+                system_parts.append("\n\n")
+            system_parts.append(language_instruction)
+            system_tokens += estimate_tokens(language_instruction)
 
-        if system_content:
+        if system_parts:
             system_message = {
                 "role": "system",
-                "content": system_content
+                "content": "".join(system_parts)
             }
-            system_tokens = estimate_messages_tokens([system_message])
+            system_tokens += MESSAGE_OVERHEAD_TOKENS
         
         # 2. Estimate tokens for the new message
         new_message_tokens = estimate_messages_tokens([new_message])
@@ -172,25 +249,23 @@ class ContextService:
             result.append(new_message)
             return result
         
-        # 4. Add history messages from most recent, working backwards
-        # Convert history to simple role/content format for LLM
+        # 4. Keep the most recent history messages that fit, dropping oldest first
         history_for_llm = [
-            {"role": msg["role"], "content": msg["content"]}
-            for msg in history
+            msg for msg in history
             if msg["role"] in ("user", "assistant")  # Only include user/assistant, not system/debug roles
         ]
         
-        selected_history = []
-        current_tokens = 0
+        # cum_tokens[i] = tokens of history_for_llm[0..i]; the kept suffix starts right
+        # after the first prefix that covers the overflow (binary search, no reverse scan)
+        cum_tokens = list(accumulate(estimate_message_tokens(msg) for msg in history_for_llm))
+        overflow = (cum_tokens[-1] if cum_tokens else 0) - remaining_budget
+        start = bisect_left(cum_tokens, overflow) + 1 if overflow > 0 else 0
         
-        # Iterate from most recent to oldest
-        for msg in reversed(history_for_llm):
-            msg_tokens = estimate_messages_tokens([msg])
-            if current_tokens + msg_tokens <= remaining_budget:
-                selected_history.insert(0, msg)  # Insert at beginning to maintain order
-                current_tokens += msg_tokens
-            else:
-                break  # Stop when budget exceeded
+        # Convert history to simple role/content format for LLM
+        selected_history = [
+            {"role": msg["role"], "content": msg["content"]}
+            for msg in history_for_llm[start:]
+        ]
         
         # 5. Build final message list
         result = []
@@ -2,15 +2,35 @@
 Language Detection Service
 """
 
-from langdetect import detect, DetectorFactory
-from fastapi import HTTPException
+from typing import Iterable
 
-# Enforce deterministic results
-DetectorFactory.seed = 0
+from lingua import IsoCode639_1, LanguageDetectorBuilder
+
+from app.services.text_utils import count_korean_chars
+
+# Texts with at least this share of Hangul are Korean; no need to run the detector
+KOREAN_SHORTCUT_RATIO = 0.3
 
 class DetectionService:
     """Service for identifying language from text"""
     
+    def __init__(self, language_codes: Iterable[str]):
+        """
+        Build a lingua detector restricted to the given ISO 639-1 codes
+        (pseudo-codes like "auto" are ignored). Models are bundled with the
+        package and preloaded here, so the first request does not pay for loading.
+        """
+        iso_codes = [
+            IsoCode639_1.from_str(code)
+            for code in language_codes
+            if hasattr(IsoCode639_1, code.upper())
+        ]
+        self._detector = (
+            LanguageDetectorBuilder.from_iso_codes_639_1(*iso_codes)
+            .with_preloaded_language_models()
+            .build()
+        )
+    
     def detect_language(self, text: str) -> str:
         """
         Detect language of the given text
@@ -18,9 +38,14 @@ class DetectionService:
         """
         if not text or len(text.strip()) < 3:
             return "auto"
+        
+        if count_korean_chars(text) > len(text) * KOREAN_SHORTCUT_RATIO:
+            return "ko"
             
         try:
-            detected = detect(text)
-            return detected
+            language = self._detector.detect_language_of(text)
+            if language is None:
+                return "auto"
+            return language.iso_code_639_1.name.lower()
         except Exception:
             return "auto"
@@ -3,8 +3,9 @@ Document Parsing Service for Chat Context
 Supports PDF, TXT, and DOCX files
 """
 
+import asyncio
+import codecs
 import io
-from typing import Optional
 from fastapi import UploadFile, HTTPException
 import fitz  # PyMuPDF
 from docx import Document
@@ -14,8 +15,21 @@ class DocumentService:
     """Service for parsing documents and extracting text content"""
     
     MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+    MAX_CHARS = 50000  # ~12,500 tokens approximately; longer documents are truncated
     ALLOWED_EXTENSIONS = {"pdf", "txt", "docx"}
     
+    # Byte order marks, longest first (the UTF-32 LE BOM starts with the UTF-16 LE one)
+    TXT_BOMS = (
+        (codecs.BOM_UTF32_LE, "utf-32"),
+        (codecs.BOM_UTF32_BE, "utf-32"),
+        (codecs.BOM_UTF8, "utf-8-sig"),
+        (codecs.BOM_UTF16_LE, "utf-16"),
+        (codecs.BOM_UTF16_BE, "utf-16"),
+    )
+    # Without a BOM: UTF-8, then Korean legacy (cp949 is a superset of euc-kr),
+    # then latin-1 which accepts any byte sequence
+    TXT_FALLBACK_ENCODINGS = ("utf-8", "cp949", "latin-1")
+    
     def __init__(self):
         pass
     
@@ -42,28 +56,42 @@ class DocumentService:
             )
     
     def _parse_pdf(self, content: bytes) -> str:
-        """Extract text from PDF file"""
-        text_parts = []
+        """Extract text from PDF file (stops once MAX_CHARS is exceeded)"""
+        buf = io.StringIO()
+        written = 0
         try:
             with fitz.open(stream=content, filetype="pdf") as doc:
                 for page_num, page in enumerate(doc, 1):
+                    if written > self.MAX_CHARS:
+                        break  # remaining pages would be truncated anyway
                     page_text = page.get_text()
                     if page_text.strip():
-                        text_parts.append(f"[Page {page_num}]\n{page_text}")
+                        if written:
+                            written += buf.write("\n\n")
+                        written += buf.write(f"[Page {page_num}]\n")
+                        written += buf.write(page_text)
         except Exception as e:
             raise HTTPException(
                 status_code=400,
                 detail=f"PDF 파일을 읽는 중 오류가 발생했습니다: {str(e)}"
             )
         
-        return "\n\n".join(text_parts)
+        return buf.getvalue()
     
     def _parse_docx(self, content: bytes) -> str:
-        """Extract text from DOCX file"""
+        """Extract text from DOCX file (stops once MAX_CHARS is exceeded)"""
         try:
             doc = Document(io.BytesIO(content))
-            paragraphs = [para.text for para in doc.paragraphs if para.text.strip()]
-            return "\n\n".join(paragraphs)
+            buf = io.StringIO()
+            written = 0
+            for para in doc.paragraphs:
+                if written > self.MAX_CHARS:
+                    break
+                if para.text.strip():
+                    if written:
+                        written += buf.write("\n\n")
+                    written += buf.write(para.text)
+            return buf.getvalue()
         except Exception as e:
             raise HTTPException(
                 status_code=400,
@@ -73,8 +101,13 @@ class DocumentService:
     def _parse_txt(self, content: bytes) -> str:
         """Extract text from TXT file"""
         try:
-            # Try UTF-8 first, then fallback to other encodings
-            for encoding in ["utf-8", "utf-16", "cp949", "euc-kr", "latin-1"]:
+            # A BOM identifies the encoding outright: decode once
+            head = content[:4]
+            for bom, encoding in self.TXT_BOMS:
+                if head.startswith(bom):
+                    return content.decode(encoding)
+            
+            for encoding in self.TXT_FALLBACK_ENCODINGS:
                 try:
                     return content.decode(encoding)
                 except UnicodeDecodeError:
@@ -106,22 +139,23 @@ class DocumentService:
         # Validate file
         self._validate_file(file, content)
         
-        # Get extension and parse accordingly
+        # Get extension and parse accordingly.
+        # Parsers are CPU-bound and synchronous, so run them in a worker thread
+        # to keep the event loop free for concurrent requests.
         extension = self._get_extension(file.filename or "")
         
         if extension == "pdf":
-            text = self._parse_pdf(content)
+            text = await asyncio.to_thread(self._parse_pdf, content)
         elif extension == "docx":
-            text = self._parse_docx(content)
+            text = await asyncio.to_thread(self._parse_docx, content)
         elif extension == "txt":
-            text = self._parse_txt(content)
+            text = await asyncio.to_thread(self._parse_txt, content)
         else:
             text = ""
         
         # Truncate very long documents to prevent context overflow
-        max_chars = 50000  # ~12,500 tokens approximately
-        if len(text) > max_chars:
-            text = text[:max_chars] + "\n\n[... 문서가 너무 길어 일부만 표시됩니다 ...]"
+        if len(text) > self.MAX_CHARS:
+            text = text[:self.MAX_CHARS] + "\n\n[... 문서가 너무 길어 일부만 표시됩니다 ...]"
         
         return {
             "filename": file.filename,
@@ -2,149 +2,358 @@
 Ollama Service for TranslateGemma 12B Integration
 """
 
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
 import httpx
-import json
-from typing import AsyncGenerator
+import orjson
+from fastapi import Request
+from types import MappingProxyType
+from typing import AsyncGenerator, AsyncIterator, Optional
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OLLAMA_URL = "http://localhost:11434"
+
+# Language code -> name used in translation prompts
+LANG_NAMES = MappingProxyType({
+    "ko": "Korean", "en": "English", "ja": "Japanese",
+    "zh": "Chinese", "es": "Spanish", "fr": "French",
+    "de": "German", "pt": "Portuguese", "ru": "Russian",
+    "ar": "Arabic", "hi": "Hindi", "vi": "Vietnamese",
+    "th": "Thai", "id": "Indonesian", "auto": "auto-detected language"
+})
+
+
+def _prompt_prefix(source_lang: str, target_lang: str) -> str:
+    """Instruction part of the translation prompt; unknown codes are used as-is"""
+    source = LANG_NAMES.get(source_lang, source_lang)
+    target = LANG_NAMES.get(target_lang, target_lang)
+    
+    if source_lang == "auto":
+        return f"Translate the following text to {target}:\n\n"
+    else:
+        return f"Translate the following text from {source} to {target}:\n\n"
+
+
+# Every supported (source, target) prefix, built once at import
+_PROMPT_PREFIXES = MappingProxyType({
+    (s, t): _prompt_prefix(s, t) for s in LANG_NAMES for t in LANG_NAMES
+})
+
+# Pre-encoded SSE framing: one bytes concatenation per event, no str formatting
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+_SSE_DONE = b"data: [DONE]\n\n"
+
+# chat_stream merges tokens into one SSE frame per this many tokens / seconds
+STREAM_COALESCE_TOKENS = 8
+STREAM_COALESCE_INTERVAL = 0.010
+
+
+def create_ollama_client(base_url: str = DEFAULT_OLLAMA_URL) -> httpx.AsyncClient:
+    """Keep-alive client for the Ollama API (timeouts are set per request)"""
+    return httpx.AsyncClient(
+        base_url=base_url,
+        timeout=None,
+        limits=httpx.Limits(
+            max_connections=64,
+            max_keepalive_connections=32,
+            # Users often idle a minute or two between turns; keep sockets warm across that
+            keepalive_expiry=120,
+        ),
+    )
+
+
+# Model inventory rarely changes; reuse a /api/tags result for this long
+MODEL_CHECK_TTL = 30.0  # seconds
+
+# Exact-match translation cache entries (key: langs + 16-byte text digest)
+TRANSLATION_CACHE_SIZE = 10_000
+
+# Generated titles cached by (model, first user/assistant turn) digest
+TITLE_CACHE_SIZE = 2048
+
+# Title streaming stops once a line of this many chars is produced (titles are 5-7 words)
+TITLE_MAX_CHARS = 80
+
+# Overall limit for title generation; a new session's first turn is saved only
+# after its title, so this also bounds how long that turn stays unsaved
+TITLE_TIMEOUT = 5.0  # seconds
+
+# Keep-alive connections opened at startup (roughly the expected concurrent streams)
+OLLAMA_WARM_CONNECTIONS = 4
+
+
+async def warm_ollama_client(
+    client: httpx.AsyncClient,
+    size: int = OLLAMA_WARM_CONNECTIONS,
+) -> int:
+    """
+    Open `size` connections concurrently so the first requests skip the connect.
+    Returns how many succeeded; Ollama not running yet is not an error.
+    """
+    results = await asyncio.gather(
+        *(client.get("/api/version", timeout=5.0) for _ in range(size)),
+        return_exceptions=True,
+    )
+    return sum(1 for r in results if isinstance(r, httpx.Response))
+
+
+async def _aiter_ndjson_lines(response: httpx.Response) -> AsyncIterator[bytes]:
+    """
+    Yield the non-empty lines of an NDJSON response as raw bytes.
+    Splits on b"\\n" with bytes.find instead of aiter_lines' per-chunk
+    decode + universal-newline split; orjson parses the bytes directly.
+    """
+    buf = bytearray()
+    async for chunk in response.aiter_bytes():
+        buf += chunk
+        # Scan by offset and copy each line out of the view once; consumed
+        # bytes are dropped in a single compaction per chunk, not per line
+        start = 0
+        with memoryview(buf) as mv:
+            while (i := buf.find(b"\n", start)) != -1:
+                # Treat CRLF like LF, as aiter_lines did
+                end = i - 1 if i > start and buf[i - 1] == 0x0D else i
+                if end > start:
+                    yield bytes(mv[start:end])
+                start = i + 1
+        if start:
+            del buf[:start]
+    if buf.endswith(b"\r"):
+        del buf[-1:]
+    if buf:
+        yield bytes(buf)
+
+
+def _title_ready(content: str) -> bool:
+    """True once the title line after any leading <think> block is complete"""
+    head = content.lstrip()
+    if head.startswith("<think>"):
+        _, sep, head = head.partition("</think>")
+        if not sep:
+            return False
+        head = head.lstrip()
+    return "\n" in head or len(head) >= TITLE_MAX_CHARS
+
+
+async def get_ollama_service(request: Request) -> "OllamaService":
+    """FastAPI dependency: the app-wide OllamaService created in the lifespan"""
+    return request.app.state.ollama
 
 
 class OllamaService:
     """Service for interacting with Ollama API running TranslateGemma 12B"""
     
-    def __init__(self, base_url: str = "http://localhost:11434"):
+    def __init__(self, base_url: str = DEFAULT_OLLAMA_URL, client: Optional[httpx.AsyncClient] = None):
         self.base_url = base_url
         self.model = "translategemma:12b"
+        # An injected client is owned (and closed) by the caller
+        self._owns_client = client is None
+        self._client = client if client is not None else create_ollama_client(base_url)
+        # check_model_available cache: (monotonic timestamp, result)
+        self._model_check: Optional[tuple] = None
+        self._model_check_lock = asyncio.Lock()
+        # translate() results, LRU order: (source, target, blake2b(text)) -> translation
+        self._translation_cache: "OrderedDict[tuple, str]" = OrderedDict()
+        # generate_title() results, LRU order: blake2b(model|user|assistant) -> title
+        self._title_cache: "OrderedDict[bytes, str]" = OrderedDict()
+    
+    async def aclose(self) -> None:
+        """Close the underlying HTTP client if this service created it"""
+        if self._owns_client:
+            await self._client.aclose()
     
     def _build_prompt(self, text: str, source_lang: str, target_lang: str) -> str:
         """Build translation prompt for TranslateGemma"""
-        lang_names = {
-            "ko": "Korean", "en": "English", "ja": "Japanese",
-            "zh": "Chinese", "es": "Spanish", "fr": "French",
-            "de": "German", "pt": "Portuguese", "ru": "Russian",
-            "ar": "Arabic", "hi": "Hindi", "vi": "Vietnamese",
-            "th": "Thai", "id": "Indonesian", "auto": "auto-detected language"
-        }
-        
-        source = lang_names.get(source_lang, source_lang)
-        target = lang_names.get(target_lang, target_lang)
-        
-        if source_lang == "auto":
-            return f"Translate the following text to {target}:\n\n{text}"
-        else:
-            return f"Translate the following text from {source} to {target}:\n\n{text}"
+        prefix = _PROMPT_PREFIXES.get((source_lang, target_lang))
+        if prefix is None:
+            prefix = _prompt_prefix(source_lang, target_lang)
+        return prefix + text
     
     async def translate(self, text: str, source_lang: str, target_lang: str) -> str:
         """
-        Perform translation using TranslateGemma 12B
+        Perform translation using TranslateGemma 12B.
+        Repeated requests for the same text and language pair are served from an LRU cache.
         """
+        key = (source_lang, target_lang, hashlib.blake2b(text.encode(), digest_size=16).digest())
+        cached = self._translation_cache.get(key)
+        if cached is not None:
+            self._translation_cache.move_to_end(key)
+            return cached
+        
         prompt = self._build_prompt(text, source_lang, target_lang)
         
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.3,
-                        "top_p": 0.9,
-                    }
+        response = await self._client.post(
+            "/api/generate",
+            json={
+                "model": self.model,
+                "prompt": prompt,
+                "stream": False,
+                "options": {
+                    "temperature": 0.3,
+                    "top_p": 0.9,
                 }
-            )
-            response.raise_for_status()
-            result = response.json()
-            return result.get("response", "").strip()
+            },
+            timeout=120.0
+        )
+        response.raise_for_status()
+        result = orjson.loads(response.content)
+        translated = result.get("response", "").strip()
+        
+        if translated:
+            self._translation_cache[key] = translated
+            if len(self._translation_cache) > TRANSLATION_CACHE_SIZE:
+                self._translation_cache.popitem(last=False)
+        return translated
     
     async def translate_stream(
         self, text: str, source_lang: str, target_lang: str
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[bytes, None]:
         """
         Stream translation response for real-time display
         """
         prompt = self._build_prompt(text, source_lang, target_lang)
         
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            async with client.stream(
-                "POST",
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": True,
-                    "options": {
-                        "temperature": 0.3,
-                        "top_p": 0.9,
-                    }
+        async with self._client.stream(
+            "POST",
+            "/api/generate",
+            json={
+                "model": self.model,
+                "prompt": prompt,
+                "stream": True,
+                "options": {
+                    "temperature": 0.3,
+                    "top_p": 0.9,
                 }
-            ) as response:
-                async for line in response.aiter_lines():
-                    if line:
-                        try:
-                            data = json.loads(line)
-                            if "response" in data:
-                                yield f"data: {json.dumps({'text': data['response']})}\n\n"
-                            if data.get("done", False):
-                                yield "data: [DONE]\n\n"
-                        except json.JSONDecodeError:
-                            continue
+            },
+            timeout=120.0
+        ) as response:
+            async for line in _aiter_ndjson_lines(response):
+                try:
+                    data = orjson.loads(line)
+                    # One lookup per key; the final (done) line ends the stream
+                    resp = data.get("response")
+                    if resp:
+                        yield _SSE_PREFIX + orjson.dumps({'text': resp}) + _SSE_SUFFIX
+                    if data.get("done"):
+                        yield _SSE_DONE
+                        return
+                except orjson.JSONDecodeError:
+                    continue
     
-    async def check_model_available(self) -> bool:
-        """Check if TranslateGemma model is available"""
+    async def check_model_available(self, force: bool = False) -> bool:
+        """
+        Check if TranslateGemma model is available.
+        The result is cached for MODEL_CHECK_TTL seconds; pass force=True to re-query.
+        """
+        cached = self._model_check
+        if not force and cached and time.monotonic() - cached[0] < MODEL_CHECK_TTL:
+            return cached[1]
+        
+        # One refresh at a time; waiters reuse the result it stored
+        async with self._model_check_lock:
+            cached = self._model_check
+            if not force and cached and time.monotonic() - cached[0] < MODEL_CHECK_TTL:
+                return cached[1]
+            available = await self._fetch_model_available()
+            self._model_check = (time.monotonic(), available)
+            return available
+    
+    async def _fetch_model_available(self) -> bool:
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(f"{self.base_url}/api/tags")
-                if response.status_code == 200:
-                    models = response.json().get("models", [])
-                    return any(self.model in m.get("name", "") for m in models)
+            response = await self._client.get("/api/tags", timeout=10.0)
+            if response.status_code == 200:
+                models = orjson.loads(response.content).get("models", [])
+                return any(self.model in m.get("name", "") for m in models)
         except Exception:
             pass
         return False
 
-    async def chat_stream(self, messages: list, model: str = None) -> AsyncGenerator[str, None]:
+    async def chat_stream(self, messages: list, model: str = None) -> AsyncGenerator[bytes, None]:
         """
-        Stream chat response using specified model (default: DeepSeek-R1)
+        Stream chat response using specified model (default: DeepSeek-R1).
+        Tokens are coalesced into frames of up to STREAM_COALESCE_TOKENS tokens
+        or STREAM_COALESCE_INTERVAL seconds, so fewer writes reach the socket.
         """
         target_model = model or "deepseek-r1:32b"
         
-        async with httpx.AsyncClient(timeout=300.0) as client:
-            async with client.stream(
-                "POST",
-                f"{self.base_url}/api/chat",
-                json={
-                    "model": target_model,
-                    "messages": messages,
-                    "stream": True,
-                    "options": {
-                        "temperature": 0.6,  # Slightly higher for creativity in chat
-                    }
+        def frame(tokens: list) -> bytes:
+            return _SSE_PREFIX + orjson.dumps({'content': "".join(tokens)}) + _SSE_SUFFIX
+        
+        pending = []
+        loop = asyncio.get_running_loop()
+        last_flush = loop.time()
+        
+        async with self._client.stream(
+            "POST",
+            "/api/chat",
+            json={
+                "model": target_model,
+                "messages": messages,
+                "stream": True,
+                "options": {
+                    "temperature": 0.6,  # Slightly higher for creativity in chat
                 }
-            ) as response:
-                async for line in response.aiter_lines():
-                    if line:
-                        # print(f"DEBUG: Received line: {line[:100]}...") # Uncomment for verbose debug
-                        try:
-                            data = json.loads(line)
-                            if "message" in data and "content" in data["message"]:
-                                content = data["message"]["content"]
-                                if content:
-                                    yield f"data: {json.dumps({'content': content})}\n\n"
+            },
+            timeout=300.0
+        ) as response:
+            try:
+                async for line in _aiter_ndjson_lines(response):
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Received line: %s...", line[:100])
+                    # Ollama NDJSON lines are JSON objects; anything else is noise,
+                    # skipped without raising (and catching) a decode error.
+                    # Surrounding whitespace is fine for orjson, so look past it.
+                    shape = line.strip()
+                    if shape[:1] != b"{" or shape[-1:] != b"}":
+                        logger.warning("Skipping non-JSON line: %s", line[:100])
+                        continue
+                    try:
+                        data = orjson.loads(line)
+                        message = data.get("message")
+                        if message:
+                            content = message.get("content")
+                            if content:
+                                pending.append(content)
+                                now = loop.time()
+                                if len(pending) >= STREAM_COALESCE_TOKENS or now - last_flush >= STREAM_COALESCE_INTERVAL:
+                                    yield frame(pending)
+                                    pending.clear()
+                                    last_flush = now
+                        
+                        # Handle done status: nothing follows the final line
+                        if data.get("done"):
+                            if pending:
+                                yield frame(pending)
+                                pending.clear()
+                            yield _SSE_DONE
+                            return
                             
-                            # Handle done status
-                            if data.get("done", False):
-                                yield "data: [DONE]\n\n"
-                                
-                        except json.JSONDecodeError:
-                            print(f"JSON Decode Error for line: {line}")
-                            continue
-                        except Exception as e:
-                            print(f"Error processing chunk: {e}")
-                            continue
+                    except orjson.JSONDecodeError:
+                        logger.warning("JSON decode error for line: %s", line)
+                        continue
+                    except Exception as e:
+                        logger.warning("Error processing chunk: %s", e)
+                        continue
+            except Exception:
+                # Hand over tokens already received before the error propagates
+                if pending:
+                    yield frame(pending)
+                raise
+            
+            if pending:
+                yield frame(pending)
 
     async def generate_title(self, user_content: str, assistant_content: str, model: str) -> str:
         """
         Generate a concise title for the chat session based on the first interaction.
         """
-        print(f"DEBUG: Entering generate_title with model={model}")
+        logger.debug("Entering generate_title with model=%s", model)
         prompt = f"""Generate a very concise title (maximum 5-7 words) for this chat conversation.
 Do not use quotes. Do not saying "Title: ". Just the title itself.
 
@@ -155,37 +364,87 @@ Title:"""
         
         target_model = model or "deepseek-r1:32b"
         
+        # Same opening turn and model -> same title; skip the Ollama round-trip
+        key = hashlib.blake2b(
+            f"{target_model}|{user_content[:200]}|{assistant_content[:200]}".encode(),
+            digest_size=16,
+        ).digest()
+        cached = self._title_cache.get(key)
+        if cached is not None:
+            self._title_cache.move_to_end(key)
+            return cached
+        
         try:
-            print(f"DEBUG: Calling Ollama API for title...")
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/chat",
-                    json={
-                        "model": target_model,
-                        "messages": [{"role": "user", "content": prompt}],
-                        "stream": False,
-                        "options": {
-                            "temperature": 0.3,
-                        }
-                    }
-                )
-                print(f"DEBUG: Ollama response status: {response.status_code}")
-                if response.status_code == 200:
-                    data = response.json()
-                    content = data.get("message", {}).get("content", "").strip()
-                    
-                    if "<think>" in content:
-                        parts = content.split("</think>")
-                        if len(parts) > 1:
-                            content = parts[1].strip()
-                    
-                    content = content.strip('"').strip("'")
-                    print(f"DEBUG: Generated title: {content}")
-                    
-                    return content if content else "New Chat"
+            logger.debug("Calling Ollama API for title...")
+            # httpx timeouts only bound each read; a model that keeps streaming
+            # <think> tokens would never hit them, so cap the whole generation
+            content = await asyncio.wait_for(
+                self._stream_title_text(target_model, prompt), TITLE_TIMEOUT
+            )
+            if content is None:
+                return "New Chat"
+            content = content.strip()
+            
+            if "<think>" in content:
+                _, sep, tail = content.partition("</think>")
+                if sep:
+                    content = tail.strip()
+            
+            content = content.partition("\n")[0].strip()
+            content = content.strip('"').strip("'")
+            logger.debug("Generated title: %s", content)
+            
+            if not content:
+                return "New Chat"
+            self._title_cache[key] = content
+            if len(self._title_cache) > TITLE_CACHE_SIZE:
+                self._title_cache.popitem(last=False)
+            return content
+        except asyncio.TimeoutError:
+            logger.warning("Title generation exceeded %.1fs, using default title", TITLE_TIMEOUT)
         except Exception as e:
-            print(f"Error generating title: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.error("Error generating title: %s", e, exc_info=True)
         
         return "New Chat"
+    
+    async def _stream_title_text(self, target_model: str, prompt: str) -> Optional[str]:
+        """
+        Stream the title completion and return the raw text, or None on an HTTP error.
+        Stops as soon as the title line is done instead of waiting for the whole
+        generation; leaving the stream early closes the connection, which makes
+        Ollama stop generating. No num_predict/stop options: reasoning models
+        emit <think> first.
+        """
+        parts = []
+        total = checked = 0
+        async with self._client.stream(
+            "POST",
+            "/api/chat",
+            json={
+                "model": target_model,
+                "messages": [{"role": "user", "content": prompt}],
+                "stream": True,
+                "options": {
+                    "temperature": 0.3,
+                }
+            },
+            timeout=TITLE_TIMEOUT
+        ) as response:
+            logger.debug("Ollama response status: %s", response.status_code)
+            if response.status_code != 200:
+                return None
+            async for line in _aiter_ndjson_lines(response):
+                data = orjson.loads(line)
+                piece = data.get("message", {}).get("content", "")
+                if piece:
+                    parts.append(piece)
+                    total += len(piece)
+                if data.get("done", False):
+                    break
+                # Join only when the title could have just completed
+                if "\n" in piece or total - checked >= TITLE_MAX_CHARS:
+                    checked = total
+                    if _title_ready("".join(parts)):
+                        break
+        
+        return "".join(parts)
@@ -0,0 +1,14 @@
+"""
+Text helpers shared by services (no app/database imports)
+"""
+
+import re
+
+
+# Runs of Hangul syllables (U+AC00-U+D7A3) and compatibility jamo (U+3131-U+318E)
+_KOREAN_RUN_RE = re.compile("[\uac00-\ud7a3\u3131-\u318e]+")
+
+
+def count_korean_chars(text: str) -> int:
+    """Count Hangul characters; the scan runs in the regex engine instead of a Python loop."""
+    return sum(map(len, _KOREAN_RUN_RE.findall(text)))
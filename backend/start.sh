@@ -1,2 +1,2 @@
 #!/bin/bash
-PYTHONPATH=$(pwd) ./venv/bin/python -m uvicorn app.main:app --host 0.0.0.0 --port 8001 --reload
+PYTHONPATH=$(pwd) ./venv/bin/python -m uvicorn app.main:app --host 0.0.0.0 --port 8001 --reload --loop uvloop --http httptools
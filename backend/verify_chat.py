@@ -1,5 +1,4 @@
 import httpx
-import json
 import asyncio
 
 url = "http://localhost:8000/api/chat/stream"
@@ -311,7 +311,7 @@ Remember to respond in ${language === 'ko' ? 'Korean' : 'English'}.
                 const { done, value } = await reader.read();
                 if (done) break;
 
-                const chunk = decoder.decode(value);
+                const chunk = decoder.decode(value, { stream: true });
                 const lines = chunk.split("\n");
 
                 for (const line of lines) {